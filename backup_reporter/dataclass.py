@@ -1,6 +1,7 @@
 import json
 
 from dataclasses import dataclass, asdict
+from datetime import datetime
 
 
 @dataclass
@@ -20,3 +21,54 @@ class BackupMetadata:
     def __str__(self):
         '''String representation of that DataClass is valid json string'''
         return json.dumps(asdict(self), default=str)
+
+
+@dataclass
+class ListingCheckpoint:
+    '''Class contain state of previous bucket listing, used to list only new keys on next runs'''
+    scope: str = None
+    count: int = 0
+    latest_key: str = None
+    latest_last_modified: datetime = None
+    latest_size: int = 0
+    last_seen_key: str = None
+    last_full_scan: datetime = None
+
+    def __str__(self):
+        '''String representation of that DataClass is valid json string'''
+        return json.dumps(asdict(self), default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+    @staticmethod
+    def _parse_datetime(value: str) -> datetime:
+        '''Parse isoformat string, only timezone-aware values are accepted'''
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            raise ValueError(f"Datetime {value} has no timezone")
+        return parsed
+
+    @classmethod
+    def from_json(cls, data: str) -> "ListingCheckpoint":
+        '''
+            Build checkpoint from json string, unknown fields are ignored.
+            Raises ValueError if checkpoint is damaged.
+        '''
+        fields = json.loads(data)
+        if not isinstance(fields, dict):
+            raise ValueError("Checkpoint must be a json object")
+        checkpoint = cls(**{k: v for k, v in fields.items() if k in cls.__dataclass_fields__})
+
+        for name in ("scope", "latest_key", "last_seen_key"):
+            if not isinstance(getattr(checkpoint, name), (str, type(None))):
+                raise ValueError(f"Checkpoint field {name} must be a string")
+        for name in ("count", "latest_size"):
+            value = getattr(checkpoint, name)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"Checkpoint field {name} must be an integer")
+        if not isinstance(checkpoint.last_full_scan, str):
+            raise ValueError("Checkpoint field last_full_scan must be a string")
+        checkpoint.last_full_scan = cls._parse_datetime(checkpoint.last_full_scan)
+        if checkpoint.latest_last_modified is not None:
+            if not isinstance(checkpoint.latest_last_modified, str):
+                raise ValueError("Checkpoint field latest_last_modified must be a string")
+            checkpoint.latest_last_modified = cls._parse_datetime(checkpoint.latest_last_modified)
+        return checkpoint
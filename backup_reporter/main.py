@@ -59,7 +59,9 @@ def start():
             supposed_backups_count = confs.get("supposed_backups_count", None),
             aws_endpoint_url = confs["bucket"][0].get("aws_endpoint_url", None),
             description = confs.get("description", None),
-            files_mask = confs.get("files_mask", None)
+            files_mask = confs.get("files_mask", None),
+            listing_checkpoint = confs.get("listing_checkpoint", None),
+            listing_full_rescan_hours = confs.get("listing_full_rescan_hours", 24)
         )
         reporter.report()
 
@@ -74,6 +76,8 @@ def start():
             supposed_backups_count = confs.get("supposed_backups_count", None),
             aws_endpoint_url = confs["bucket"][0].get("aws_endpoint_url", None),
             description = confs.get("description", None),
+            listing_checkpoint = confs.get("listing_checkpoint", None),
+            listing_full_rescan_hours = confs.get("listing_full_rescan_hours", 24)
         )
         reporter.report()
 
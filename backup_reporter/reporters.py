@@ -1,13 +1,17 @@
 import boto3
 import json
 import logging
+import os
 import pytz
+import re
 
 from abc import ABC
-from datetime import datetime
-from backup_reporter.dataclass import BackupMetadata
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from backup_reporter.dataclass import BackupMetadata, ListingCheckpoint
 from backup_reporter.utils import exec_cmd
 from fnmatch import fnmatch
+from typing import Union
 
 
 class BackupReporter(ABC):
@@ -25,12 +29,23 @@ class BackupReporter(ABC):
             customer: str,
             supposed_backups_count: str,
             description: str,
-            aws_endpoint_url: str = None) -> None:
+            aws_endpoint_url: str = None,
+            listing_checkpoint: Union[bool, str] = None,
+            listing_full_rescan_hours: int = 24) -> None:
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.aws_region = aws_region
         self.aws_endpoint_url = aws_endpoint_url
         self.s3_path = s3_path
+        # Either True (store checkpoint next to metadata file in S3), path to local file or None (disabled)
+        if isinstance(listing_checkpoint, str) and listing_checkpoint.strip().lower() in ("true", "yes", "on"):
+            listing_checkpoint = True
+        elif isinstance(listing_checkpoint, str) and listing_checkpoint.strip().lower() in ("", "false", "no", "off"):
+            listing_checkpoint = None
+        self.listing_checkpoint = listing_checkpoint or None
+        self.listing_full_rescan_hours = int(listing_full_rescan_hours)
+        # Set by _gather_metadata and saved only after metadata is uploaded
+        self.checkpoint = None
 
         self.metadata = BackupMetadata()
         self.metadata.type = type
@@ -45,6 +60,78 @@ class BackupReporter(ABC):
         '''
         raise Exception('Method _gather_metadata must be overwritten in child class')
 
+    def _metadata_s3_key(self) -> str:
+        '''Key of metadata file inside of bucket'''
+        return "/".join(self.s3_path.split("/")[3:])
+
+    def _checkpoint_s3_key(self) -> str:
+        '''Checkpoint is stored next to metadata file and named after it: metadata/app.json -> metadata/app.listing-checkpoint.json'''
+        return f"{os.path.splitext(self._metadata_s3_key())[0]}.listing-checkpoint.json"
+
+    def _checkpoint_scope(self, listing_scope: str) -> str:
+        '''Checkpoint is valid only for the same endpoint, bucket, metadata file and listing'''
+        return f"{self.aws_endpoint_url or ''} {self.s3_path} {listing_scope}"
+
+    def _load_checkpoint(self, s3_client, scope: str) -> ListingCheckpoint:
+        '''
+            Load listing checkpoint saved by previous run.
+            Returns None if checkpoint is disabled, absent, broken, made for another scope
+            or too old - in all these cases caller must do a full listing.
+        '''
+        if not self.listing_checkpoint:
+            return None
+        try:
+            if self.listing_checkpoint is True:
+                bucket_name = self.s3_path.split("/")[2]
+                response = s3_client.get_object(Bucket=bucket_name, Key=self._checkpoint_s3_key())
+                checkpoint = ListingCheckpoint.from_json(response["Body"].read())
+            else:
+                with open(self.listing_checkpoint) as checkpoint_file:
+                    checkpoint = ListingCheckpoint.from_json(checkpoint_file.read())
+
+        except (ClientError, OSError, ValueError, TypeError) as e:
+            logging.info(f"Listing checkpoint is not available, do full listing: {e}")
+            return None
+
+        if checkpoint.scope != scope:
+            logging.info("Listing checkpoint was made for another scope, do full listing")
+            return None
+        if datetime.now(pytz.UTC) - checkpoint.last_full_scan >= timedelta(hours=self.listing_full_rescan_hours):
+            logging.info("Listing checkpoint is outdated, do full listing to reconcile deleted backups")
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self) -> None:
+        '''
+            Save listing checkpoint for next run.
+            Checkpoint is only a cache, so failure to save it doesn't fail the report - next run does a full listing.
+        '''
+        if not self.listing_checkpoint or not self.checkpoint:
+            return
+        try:
+            if self.listing_checkpoint is True:
+                kwargs = {
+                   "aws_access_key_id": self.aws_access_key_id,
+                   "aws_secret_access_key": self.aws_secret_access_key,
+                   "region_name": self.aws_region,
+                   "endpoint_url": self.aws_endpoint_url
+                }
+                s3 = boto3.client(
+                    's3',
+                    **{k:v for k,v in kwargs.items() if v is not None}
+                )
+                bucket_name = self.s3_path.split("/")[2]
+                s3.put_object(Bucket=bucket_name, Key=self._checkpoint_s3_key(), Body=str(self.checkpoint))
+            else:
+                tmp_path = f"{self.listing_checkpoint}.tmp"
+                with open(tmp_path, "w") as checkpoint_file:
+                    checkpoint_file.write(str(self.checkpoint))
+                os.replace(tmp_path, self.listing_checkpoint)
+        except (ClientError, OSError) as e:
+            logging.warning(f"Could not save listing checkpoint, next run will do full listing: {e}")
+            return
+        logging.debug(f"Listing checkpoint saved: {self.checkpoint}")
+
     def _upload_metadata(self, metadata: BackupMetadata) -> None:
         '''Upload metadata file to place, where backups stored'''
         logging.info(f"Uploud metadata to {self.s3_path} ...")
@@ -67,6 +154,8 @@ class BackupReporter(ABC):
         '''Check backup status, compile it to json metadata file and upload'''
         metadata = self._gather_metadata()
         self._upload_metadata(metadata)
+        # Checkpoint is moved forward only when report is really published
+        self._save_checkpoint()
 
 
 class DockerPostgresBackupReporter(BackupReporter):
@@ -156,7 +245,9 @@ class FilesBucketReporterBackupReporter(BackupReporter):
             supposed_backups_count: str,
             description: str,
             files_mask: str,
-            aws_endpoint_url: str = None) -> None:
+            aws_endpoint_url: str = None,
+            listing_checkpoint: Union[bool, str] = None,
+            listing_full_rescan_hours: int = 24) -> None:
 
         super().__init__(
             aws_access_key_id = aws_access_key_id,
@@ -167,7 +258,9 @@ class FilesBucketReporterBackupReporter(BackupReporter):
             supposed_backups_count = supposed_backups_count,
             type = "FilesBucket",
             description = description,
-            aws_endpoint_url = aws_endpoint_url)
+            aws_endpoint_url = aws_endpoint_url,
+            listing_checkpoint = listing_checkpoint,
+            listing_full_rescan_hours = listing_full_rescan_hours)
 
         self.metadata.last_backup_date = None
         self.files_mask = files_mask
@@ -182,22 +275,60 @@ class FilesBucketReporterBackupReporter(BackupReporter):
            "region_name": self.aws_region,
            "endpoint_url": self.aws_endpoint_url
         }
-        s3 = boto3.resource(
+        s3 = boto3.client(
             's3',
             **{k:v for k,v in kwargs.items() if v is not None}
         )
 
         bucket_name = self.s3_path.split("/")[2]
-        s3 = s3.Bucket(bucket_name)
+        # With checkpoint enabled reporter own files are never counted as backups and must not move last seen key
+        own_keys = (self._metadata_s3_key(), self._checkpoint_s3_key()) if self.listing_checkpoint else ()
+        # List only keys which can match files mask at all
+        prefix = re.split(r"[*?\[]", self.files_mask, maxsplit=1)[0]
+
+        scope = self._checkpoint_scope(self.files_mask)
+        checkpoint = self._load_checkpoint(s3, scope=scope)
+        if checkpoint:
+            # Backups are append-only, so list only keys after the last seen one.
+            # Deleted backups are reconciled by the periodic full listing.
+            logging.info(f"Listing keys after {checkpoint.last_seen_key} ...")
+            latest_backup = {"key": None, "last_modified": datetime(2000, 1, 1, tzinfo=pytz.UTC), "size": 0}
+            if checkpoint.latest_last_modified:
+                latest_backup = {
+                    "key": checkpoint.latest_key,
+                    "last_modified": checkpoint.latest_last_modified,
+                    "size": checkpoint.latest_size}
+            count_of_backups = checkpoint.count
+            last_seen_key = checkpoint.last_seen_key
+            last_full_scan = checkpoint.last_full_scan
+        else:
+            latest_backup = {"key": None, "last_modified": datetime(2000, 1, 1, tzinfo=pytz.UTC), "size": 0} # Default latest backup
+            count_of_backups = 0
+            last_seen_key = None
+            last_full_scan = datetime.now(pytz.UTC)
 
-        latest_backup = {"key": None, "last_modified": datetime(2000, 1, 1, tzinfo=pytz.UTC), "size": 0} # Default latest backup
-        count_of_backups = 0
+        list_kwargs = {"Bucket": bucket_name, "Prefix": prefix}
+        if last_seen_key:
+            list_kwargs["StartAfter"] = last_seen_key
         # Get latest backup file
-        for object in s3.objects.all():
-            if fnmatch(object.key, self.files_mask): # Check if object name matches with files mask from config file
-                if latest_backup["last_modified"] < object.last_modified:
-                    latest_backup = {"key": object.key, "last_modified": object.last_modified, "size": object.size}
-                count_of_backups += 1
+        for page in s3.get_paginator("list_objects_v2").paginate(**list_kwargs):
+            for object in page.get("Contents", []):
+                if object["Key"] in own_keys:
+                    continue
+                if fnmatch(object["Key"], self.files_mask): # Check if object name matches with files mask from config file
+                    if latest_backup["last_modified"] < object["LastModified"]:
+                        latest_backup = {"key": object["Key"], "last_modified": object["LastModified"], "size": object["Size"]}
+                    count_of_backups += 1
+                    last_seen_key = object["Key"]
+
+        self.checkpoint = ListingCheckpoint(
+            scope = scope,
+            count = count_of_backups,
+            latest_key = latest_backup["key"],
+            latest_last_modified = latest_backup["last_modified"],
+            latest_size = latest_backup["size"],
+            last_seen_key = last_seen_key,
+            last_full_scan = last_full_scan)
 
         self.metadata.count_of_backups = count_of_backups
         self.metadata.last_backup_date = latest_backup["last_modified"]
@@ -221,7 +352,9 @@ class S3MariadbBackupReporter(BackupReporter):
             customer: str,
             supposed_backups_count: str,
             description: str,
-            aws_endpoint_url: str = None) -> None:
+            aws_endpoint_url: str = None,
+            listing_checkpoint: Union[bool, str] = None,
+            listing_full_rescan_hours: int = 24) -> None:
 
         super().__init__(
             aws_access_key_id = aws_access_key_id,
@@ -232,7 +365,9 @@ class S3MariadbBackupReporter(BackupReporter):
             supposed_backups_count = supposed_backups_count,
             type = "DockerMariadb",
             description = description,
-            aws_endpoint_url = aws_endpoint_url)
+            aws_endpoint_url = aws_endpoint_url,
+            listing_checkpoint = listing_checkpoint,
+            listing_full_rescan_hours = listing_full_rescan_hours)
 
         self.metadata.last_backup_date = None
 
@@ -249,31 +384,63 @@ class S3MariadbBackupReporter(BackupReporter):
         )
 
         bucket_name = self.s3_path.split("/")[2]
-        directories = []
-        count_of_backups = 0
+        full_prefix = 'mariadb/full/'
         backup_total_size = 0
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix='mariadb/full/', Delimiter='/')
-        if 'CommonPrefixes' in response:
-            directories = [prefix['Prefix'] for prefix in response['CommonPrefixes']]
-            latest_full_backup = directories[-1]
+
+        scope = self._checkpoint_scope(full_prefix)
+        checkpoint = self._load_checkpoint(s3, scope=scope)
+        if checkpoint:
+            # Full backups directories are append-only, so list only directories after the last seen one.
+            # Deleted backups are reconciled by the periodic full listing.
+            logging.info(f"Listing directories after {checkpoint.last_seen_key} ...")
+            count_of_backups = checkpoint.count
+            latest_full_backup = checkpoint.latest_key
+            last_seen_key = checkpoint.last_seen_key
+            last_full_scan = checkpoint.last_full_scan
+        else:
+            count_of_backups = 0
+            latest_full_backup = None
+            last_seen_key = None
+            last_full_scan = datetime.now(pytz.UTC)
+
+        list_kwargs = {"Bucket": bucket_name, "Prefix": full_prefix, "Delimiter": '/'}
+        if last_seen_key:
+            list_kwargs["StartAfter"] = last_seen_key
+        for page in s3.get_paginator("list_objects_v2").paginate(**list_kwargs):
+            for prefix in page.get('CommonPrefixes', []):
+                # Keys inside the last seen directory sort after StartAfter, so its prefix is returned again
+                if last_seen_key and prefix['Prefix'] <= last_seen_key:
+                    continue
+                count_of_backups += 1
+                latest_full_backup = prefix['Prefix']
+                last_seen_key = prefix['Prefix']
+
+        self.checkpoint = ListingCheckpoint(
+            scope = scope,
+            count = count_of_backups,
+            latest_key = latest_full_backup,
+            last_seen_key = last_seen_key,
+            last_full_scan = last_full_scan)
+
+        if latest_full_backup:
             latest_date_of_backup = latest_full_backup.split('/')[-2]
-            count_of_backups = len(directories)
             inc_path = 'mariadb/inc/' + latest_date_of_backup
-            response_from_inc_path = s3.list_objects_v2(Bucket=bucket_name, Prefix=inc_path, Delimiter='/')
-            if 'CommonPrefixes' in response_from_inc_path:
-                directories = [prefix['Prefix'] for prefix in response_from_inc_path['CommonPrefixes']]
+            directories = []
+            for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=inc_path, Delimiter='/'):
+                directories += [prefix['Prefix'] for prefix in page.get('CommonPrefixes', [])]
+            if directories:
                 latest_backup = directories[-1]
                 latest_date_of_backup = latest_backup.split('/')[-2]
             else:
                 logging.info("No directories found in the incremental path.")
                 latest_backup = latest_full_backup
-            objects_of_backup = s3.list_objects_v2(Bucket=bucket_name, Prefix=latest_backup)
-            if 'Contents' in objects_of_backup:
-                for obj in objects_of_backup['Contents']:
+            for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=latest_backup):
+                for obj in page.get('Contents', []):
                     backup_total_size += obj['Size']
         else:
             logging.info("No directories found in the specified path.")
             latest_backup = 'None'
+            latest_date_of_backup = 'None'
             count_of_backups = 0
             backup_total_size = 0
         self.metadata.count_of_backups = count_of_backups
@@ -0,0 +1,352 @@
+import json
+import os
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytz
+from botocore.exceptions import ClientError
+
+from backup_reporter.dataclass import ListingCheckpoint
+from backup_reporter.reporters import FilesBucketReporterBackupReporter, S3MariadbBackupReporter
+
+
+CHECKPOINT_KEY = "metadata/metadata.listing-checkpoint.json"
+
+
+class FakeS3:
+    '''In-memory S3 supporting the client calls reporters use'''
+    PAGE_SIZE = 2
+
+    def __init__(self):
+        self.objects = {}
+        self.list_calls = []
+        self.fail_uploads = False
+        self.fail_checkpoint_saves = False
+
+    def add(self, key, day=1, size=1024 * 1024, body=b""):
+        self.objects[key] = {"LastModified": datetime(2024, 1, day, tzinfo=pytz.UTC), "Size": size, "Body": body}
+
+    def _keys(self, Prefix="", StartAfter=""):
+        return sorted(k for k in self.objects if k.startswith(Prefix) and k > StartAfter)
+
+    def _page(self, keys, Prefix, Delimiter):
+        if not Delimiter:
+            return {"Contents": [{"Key": k, "LastModified": self.objects[k]["LastModified"], "Size": self.objects[k]["Size"]} for k in keys]}
+        prefixes = []
+        for key in keys:
+            rest = key[len(Prefix):]
+            if Delimiter in rest:
+                common = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if common not in prefixes:
+                    prefixes.append(common)
+        # Like S3, omit CommonPrefixes when there are none
+        return {"CommonPrefixes": [{"Prefix": p} for p in prefixes]} if prefixes else {}
+
+    def get_paginator(self, name):
+        fake = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix="", Delimiter=None, StartAfter=""):
+                fake.list_calls.append({"Prefix": Prefix, "StartAfter": StartAfter})
+                keys = fake._keys(Prefix, StartAfter)
+                for i in range(0, len(keys), fake.PAGE_SIZE):
+                    yield fake._page(keys[i:i + fake.PAGE_SIZE], Prefix, Delimiter)
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = mock.Mock()
+        body.read.return_value = self.objects[Key]["Body"]
+        return {"Body": body}
+
+    def put_object(self, Bucket, Key, Body):
+        if self.fail_checkpoint_saves and Key.endswith(".listing-checkpoint.json"):
+            raise ClientError({"Error": {"Code": "AccessDenied"}}, "PutObject")
+        self.objects[Key] = {"LastModified": datetime.now(pytz.UTC), "Size": len(Body), "Body": Body}
+
+    def Object(self, Bucket, Key):
+        fake = self
+
+        class Object:
+            def put(self, Body):
+                if fake.fail_uploads:
+                    raise ClientError({"Error": {"Code": "AccessDenied"}}, "PutObject")
+                fake.put_object(Bucket, Key, Body)
+
+        return Object()
+
+
+class ReporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.s3 = FakeS3()
+        for name in ("client", "resource"):
+            patcher = mock.patch(f"boto3.{name}", return_value=self.s3)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def files_reporter(self, files_mask="backups/*.tar.gz", s3_path="s3://bucket/metadata/metadata.json", **kwargs):
+        kwargs.setdefault("listing_checkpoint", True)
+        return FilesBucketReporterBackupReporter(
+            aws_access_key_id="key", aws_secret_access_key="secret", aws_region=None,
+            s3_path=s3_path, customer="customer",
+            supposed_backups_count="3", description="files", files_mask=files_mask, **kwargs)
+
+    def mariadb_reporter(self, **kwargs):
+        kwargs.setdefault("listing_checkpoint", True)
+        return S3MariadbBackupReporter(
+            aws_access_key_id="key", aws_secret_access_key="secret", aws_region=None,
+            s3_path="s3://bucket/metadata/metadata.json", customer="customer",
+            supposed_backups_count="3", description="mariadb", **kwargs)
+
+    def checkpoint(self):
+        return ListingCheckpoint.from_json(self.s3.objects[CHECKPOINT_KEY]["Body"])
+
+    def store_checkpoint(self, **fields):
+        self.s3.put_object("bucket", CHECKPOINT_KEY, json.dumps(fields))
+
+
+class TestFilesBucketReporter(ReporterTestCase):
+    def test_incremental_runs_with_own_keys_sorted_after_backups(self):
+        counts = []
+        for day in range(1, 5):
+            self.s3.add(f"backups/{day:02}.tar.gz", day=day, size=day * 1024 * 1024)
+            reporter = self.files_reporter()
+            reporter.report()
+            counts.append(reporter.metadata.count_of_backups)
+        self.assertEqual(counts, [1, 2, 3, 4])
+        self.assertEqual(reporter.metadata.backup_name, "backups/04.tar.gz")
+        self.assertEqual(reporter.metadata.size, 4.0)
+        self.assertEqual(self.checkpoint().last_seen_key, "backups/04.tar.gz")
+        self.assertEqual(self.s3.list_calls[-1], {"Prefix": "backups/", "StartAfter": "backups/03.tar.gz"})
+
+    def test_mask_without_literal_prefix_ignores_own_keys(self):
+        counts = []
+        for day in range(1, 4):
+            self.s3.add(f"{day:02}.json", day=day)
+            reporter = self.files_reporter(files_mask="*.json")
+            reporter.report()
+            counts.append(reporter.metadata.count_of_backups)
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "02.json")
+
+    def test_local_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.json")
+            for day in range(1, 4):
+                self.s3.add(f"backups/{day:02}.tar.gz", day=day)
+                reporter = self.files_reporter(listing_checkpoint=path)
+                reporter.report()
+            self.assertEqual(reporter.metadata.count_of_backups, 3)
+            with open(path) as checkpoint_file:
+                self.assertEqual(ListingCheckpoint.from_json(checkpoint_file.read()).count, 3)
+        self.assertNotIn(CHECKPOINT_KEY, self.s3.objects)
+
+    def test_pagination(self):
+        for day in range(1, 8):
+            self.s3.add(f"backups/{day:02}.tar.gz", day=day)
+        reporter = self.files_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 7)
+        self.assertEqual(reporter.metadata.backup_name, "backups/07.tar.gz")
+
+    def test_scope_mismatch_does_full_listing(self):
+        self.s3.add("backups/01.tar.gz")
+        self.files_reporter().report()
+        self.files_reporter(files_mask="backups/*").report()
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "")
+
+    def test_outdated_checkpoint_reconciles_deleted_backups(self):
+        for day in range(1, 4):
+            self.s3.add(f"backups/{day:02}.tar.gz", day=day)
+        self.files_reporter().report()
+        del self.s3.objects["backups/01.tar.gz"]
+
+        reporter = self.files_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 3)
+
+        checkpoint = self.checkpoint()
+        checkpoint.last_full_scan = datetime.now(pytz.UTC) - timedelta(hours=25)
+        self.s3.put_object("bucket", CHECKPOINT_KEY, str(checkpoint))
+        reporter = self.files_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 2)
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "")
+
+    def test_broken_checkpoint_does_full_listing(self):
+        self.s3.add("backups/01.tar.gz")
+        self.files_reporter().report()
+        valid = json.loads(str(self.checkpoint()))
+        # Wrong on purpose, reported only if checkpoint is trusted
+        valid["count"] = 5
+        self.store_checkpoint(**valid)
+        reporter = self.files_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 5)
+
+        broken_fields = [
+            {"last_full_scan": "yesterday"},
+            {"last_full_scan": None},
+            {"last_full_scan": "2024-01-01T00:00:00"},
+            {"latest_last_modified": "bad"},
+            {"latest_last_modified": "2024-01-01T00:00:00"},
+            {"latest_last_modified": 5},
+            {"count": "5"},
+            {"count": True},
+            {"latest_size": 1.5},
+            {"last_seen_key": 5},
+            {"last_seen_key": ["backups/01.tar.gz"]},
+            {"latest_key": {"key": "backups/01.tar.gz"}},
+        ]
+        bodies = ["not json", "[1, 2]"] + [json.dumps({**valid, **fields}) for fields in broken_fields]
+        for body in bodies:
+            self.s3.put_object("bucket", CHECKPOINT_KEY, body)
+            reporter = self.files_reporter()
+            reporter.report()
+            self.assertEqual(reporter.metadata.count_of_backups, 1, body)
+
+    def test_checkpoint_is_bound_to_bucket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.json")
+            for day in range(1, 6):
+                self.s3.add(f"backups/{day:02}.tar.gz", day=day)
+            self.files_reporter(listing_checkpoint=path, s3_path="s3://bucket-a/metadata/metadata.json").report()
+            self.s3.objects.clear()
+
+            reporter = self.files_reporter(listing_checkpoint=path, s3_path="s3://bucket-b/metadata/metadata.json")
+            reporter.report()
+            self.assertEqual(reporter.metadata.count_of_backups, 0)
+            self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "")
+
+    def test_checkpoint_is_named_after_metadata_file(self):
+        self.s3.add("backups/01.tar.gz")
+        self.files_reporter(s3_path="s3://bucket/metadata/app1.json").report()
+        self.files_reporter(s3_path="s3://bucket/metadata/app2.json").report()
+        self.assertIn("metadata/app1.listing-checkpoint.json", self.s3.objects)
+        self.assertIn("metadata/app2.listing-checkpoint.json", self.s3.objects)
+
+        self.s3.add("backups/02.tar.gz", day=2)
+        reporter = self.files_reporter(s3_path="s3://bucket/metadata/app1.json")
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 2)
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "backups/01.tar.gz")
+
+    def test_checkpoint_not_saved_when_upload_fails(self):
+        self.s3.add("backups/01.tar.gz")
+        self.s3.fail_uploads = True
+        with self.assertRaises(ClientError):
+            self.files_reporter().report()
+        self.assertNotIn(CHECKPOINT_KEY, self.s3.objects)
+
+    def test_failed_checkpoint_save_does_not_fail_report(self):
+        self.s3.add("backups/01.tar.gz")
+        self.s3.fail_checkpoint_saves = True
+        reporter = self.files_reporter()
+        with self.assertLogs(level="WARNING"):
+            reporter.report()
+        self.assertIn("metadata/metadata.json", self.s3.objects)
+        self.assertNotIn(CHECKPOINT_KEY, self.s3.objects)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "missing", "checkpoint.json")
+            with self.assertLogs(level="WARNING"):
+                self.files_reporter(listing_checkpoint=path).report()
+
+    def test_string_options_are_normalised(self):
+        reporter = self.files_reporter(listing_checkpoint="True", listing_full_rescan_hours="1")
+        self.assertIs(reporter.listing_checkpoint, True)
+        self.assertEqual(reporter.listing_full_rescan_hours, 1)
+        self.assertIsNone(self.files_reporter(listing_checkpoint="false").listing_checkpoint)
+
+        self.s3.add("backups/01.tar.gz")
+        reporter.report()
+        checkpoint = self.checkpoint()
+        checkpoint.last_full_scan = datetime.now(pytz.UTC) - timedelta(hours=2)
+        self.s3.put_object("bucket", CHECKPOINT_KEY, str(checkpoint))
+        self.files_reporter(listing_checkpoint="true", listing_full_rescan_hours="1").report()
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "")
+
+    def test_metadata_file_counted_without_checkpoint(self):
+        self.s3.add("01.json")
+        self.files_reporter(files_mask="*.json", listing_checkpoint=None).report()
+        reporter = self.files_reporter(files_mask="*.json", listing_checkpoint=None)
+        reporter.report()
+        # Same as before checkpoint existed: metadata file matches mask and is counted
+        self.assertEqual(reporter.metadata.count_of_backups, 2)
+
+    def test_checkpoint_disabled_by_default(self):
+        self.s3.add("backups/01.tar.gz")
+        self.files_reporter(listing_checkpoint=None).report()
+        self.files_reporter(listing_checkpoint=None).report()
+        self.assertNotIn(CHECKPOINT_KEY, self.s3.objects)
+        self.assertEqual(self.s3.list_calls[-1]["StartAfter"], "")
+
+
+class TestS3MariadbReporter(ReporterTestCase):
+    def test_incremental_runs_skip_last_seen_directory(self):
+        counts = []
+        for day in range(1, 5):
+            self.s3.add(f"mariadb/full/2024-01-{day:02}/backup.xb", size=2 * 1024 * 1024)
+            self.s3.add(f"mariadb/full/2024-01-{day:02}/backup.xb.info")
+            reporter = self.mariadb_reporter()
+            reporter.report()
+            counts.append(reporter.metadata.count_of_backups)
+        self.assertEqual(counts, [1, 2, 3, 4])
+        self.assertEqual(reporter.metadata.backup_name, "mariadb/full/2024-01-04/")
+        self.assertEqual(reporter.metadata.last_backup_date, "2024-01-04")
+        self.assertEqual(reporter.metadata.size, 3.0)
+        full_listings = [call for call in self.s3.list_calls if call["Prefix"] == "mariadb/full/"]
+        self.assertEqual(full_listings[-1]["StartAfter"], "mariadb/full/2024-01-03/")
+
+    def test_no_new_directories(self):
+        self.s3.add("mariadb/full/2024-01-01/backup.xb")
+        self.mariadb_reporter().report()
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 1)
+        self.assertEqual(reporter.metadata.backup_name, "mariadb/full/2024-01-01/")
+
+    def test_latest_incremental_backup(self):
+        self.s3.add("mariadb/full/2024-01-01/backup.xb")
+        self.s3.add("mariadb/inc/2024-01-01/2024-01-02/backup.xb", size=5 * 1024 * 1024)
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.backup_name, "mariadb/inc/2024-01-01/")
+        self.assertEqual(reporter.metadata.size, 5.0)
+
+    def test_no_backups(self):
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 0)
+        self.assertEqual(reporter.metadata.backup_name, "None")
+
+    def test_files_checkpoint_is_not_used(self):
+        self.s3.add("mariadb/full/2024-01-01/backup.xb")
+        self.store_checkpoint(scope="*", count=10, last_seen_key="zzz",
+                              last_full_scan=datetime.now(pytz.UTC).isoformat())
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.count_of_backups, 1)
+
+    def test_broken_latest_key_does_full_listing(self):
+        self.s3.add("mariadb/full/2024-01-01/backup.xb")
+        self.mariadb_reporter().report()
+        checkpoint = json.loads(str(self.checkpoint()))
+        checkpoint["latest_key"] = 5
+        self.store_checkpoint(**checkpoint)
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.backup_name, "mariadb/full/2024-01-01/")
+
+    def test_size_listing_is_paginated(self):
+        for part in range(5):
+            self.s3.add(f"mariadb/full/2024-01-01/part{part}.xb", size=1024 * 1024)
+        reporter = self.mariadb_reporter()
+        reporter.report()
+        self.assertEqual(reporter.metadata.backup_name, "mariadb/full/2024-01-01/")
+        self.assertEqual(reporter.metadata.size, 5.0)